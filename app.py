@@ -1,54 +1,138 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, send_file, g
 from datetime import datetime
+import atexit
+import copy
 import json
 import os
 import requests
 import random
+import time
+import uuid
+
+import metrics
+import ranking
+from ratings import RatingEngine
+from roster_cache import FileRosterSource, RosterCache
+from sprite_cache import SPRITE_SIZES, UPSTREAM_URL, SpriteCache
+from state_store import TournamentStore
 
 app = Flask(__name__)
-app.secret_key = 'pokemon_tournament_game_secret_key'
-
-# Game state file
-GAME_STATE_FILE = 'game_state.json'
-
-def load_game_state():
-    if os.path.exists(GAME_STATE_FILE):
-        with open(GAME_STATE_FILE, 'r') as f:
-            return json.load(f)
-    return {
-        'current_round': 1,
-        'current_pokemon': [],
-        'winners': [],
-        'game_history': []
-    }
-
-def save_game_state(game_state):
-    with open(GAME_STATE_FILE, 'w') as f:
-        json.dump(game_state, f, indent=2)
+app.secret_key = os.environ.get('SECRET_KEY', 'pokemon_tournament_game_secret_key')
+
+# Spilled tournaments and the journal of changes made since they were written
+TOURNAMENT_DB_FILE = 'tournaments.db'
+GAME_JOURNAL_FILE = 'game_state.journal'
+
+store = TournamentStore(TOURNAMENT_DB_FILE, GAME_JOURNAL_FILE)
+
+# Set SERVER_TIMING=1 to send each request's phase breakdown to browser devtools
+SERVER_TIMING = os.environ.get('SERVER_TIMING') == '1'
+
+REQUEST_SECONDS = metrics.Histogram(
+    'pokemon_http_request_duration_seconds', 'Time spent handling a request', ['route', 'method', 'status'])
+TEMPLATE_RENDER_SECONDS = metrics.Histogram(
+    'pokemon_template_render_seconds', 'Rendering a page template', ['template'], timing_name='render')
+ROSTER_FALLBACK = metrics.Counter(
+    'pokemon_roster_fallback_total', 'Rounds started from the built-in fallback roster')
+metrics.Gauge(
+    'pokemon_state_file_bytes', 'Size of the state files on disk', ['file'],
+    callback=lambda: {
+        (path,): os.path.getsize(path)
+        for path in (GAME_JOURNAL_FILE, TOURNAMENT_DB_FILE, TOURNAMENT_DB_FILE + '-wal')
+        if os.path.exists(path)
+    })
+metrics.Gauge(
+    'pokemon_hot_tournaments', 'Tournaments held in the in-memory cache',
+    callback=lambda: store.hot_count)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if SERVER_TIMING:
+        g.timing_token = metrics.start_request_timing()
+
+@app.after_request
+def record_request_time(response):
+    elapsed = time.perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, route=route, method=request.method, status=response.status_code)
+    if SERVER_TIMING:
+        metrics.record_timing('app', elapsed)
+        response.headers['Server-Timing'] = metrics.server_timing_header()
+    return response
+
+@app.teardown_request
+def stop_request_timer(exc):
+    token = g.pop('timing_token', None)
+    if token is not None:
+        metrics.stop_request_timing(token)
+
+def current_tournament():
+    """Lock and return this browser session's tournament"""
+    if 'tournament_id' not in session:
+        session['tournament_id'] = uuid.uuid4().hex
+    return store.tournament(session['tournament_id'])
+
+def fetch_pokemon_from_api():
+    """Fetch all Pokemon from PokeAPI"""
+    response = requests.get('https://pokeapi.co/api/v2/pokemon?limit=151', timeout=10)
+    response.raise_for_status()
+    data = response.json()
+    pokemon_list = []
+
+    for pokemon in data['results']:
+        pokemon_id = pokemon['url'].split('/')[-2]
+        pokemon_list.append({
+            'id': int(pokemon_id),
+            'name': pokemon['name'].title(),
+            'image_url': f'https://raw.githubusercontent.com/PokeAPI/sprites/master/sprites/pokemon/other/official-artwork/shiny/{pokemon_id}.png'
+        })
+
+    print(f"Successfully loaded {len(pokemon_list)} Shiny Pokemon from API")
+    return pokemon_list
+
+# Roster cache; set ROSTER_SOURCE_FILE to play with a local roster instead of PokeAPI
+ROSTER_CACHE_FILE = 'roster_cache.json'
+
+if os.environ.get('ROSTER_SOURCE_FILE'):
+    roster_source = FileRosterSource(os.environ['ROSTER_SOURCE_FILE'])
+else:
+    roster_source = fetch_pokemon_from_api
+roster = RosterCache(roster_source, ROSTER_CACHE_FILE)
+roster.warm()
+
+# Artwork is served from a local cache; sprites never change, so cache them for a year
+SPRITE_CACHE_DIR = 'sprite_cache'
+SPRITE_MAX_AGE = 365 * 24 * 60 * 60
+
+sprites = SpriteCache(SPRITE_CACHE_DIR)
+
+# Every head-to-head result, across all tournaments, feeds the leaderboard
+RATINGS_DB_FILE = 'ratings.db'
+
+ratings = RatingEngine(RATINGS_DB_FILE)
+# Results are written to SQLite in batches; write out the last one on shutdown
+atexit.register(ratings.close)
+
+# Spectator streams: comment sent on idle connections, client reconnect delay
+SSE_KEEPALIVE = 15
+SSE_RETRY_MS = 3000
+
+# Upper bound on pairs returned and votes accepted by the batch endpoints
+MAX_BATCH_MATCHES = 64
 
 def get_all_pokemon():
-    """Fetch all Pokemon from PokeAPI with better error handling"""
-    try:
-        # Try to get Pokemon from API with timeout
-        response = requests.get('https://pokeapi.co/api/v2/pokemon?limit=151', timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        pokemon_list = []
-        
-        for pokemon in data['results']:
-            pokemon_id = pokemon['url'].split('/')[-2]
-            pokemon_list.append({
-                'id': int(pokemon_id),
-                'name': pokemon['name'].title(),
-                'image_url': f'https://raw.githubusercontent.com/PokeAPI/sprites/master/sprites/pokemon/other/official-artwork/shiny/{pokemon_id}.png'
-            })
-        
-        print(f"Successfully loaded {len(pokemon_list)} Shiny Pokemon from API")
-        return pokemon_list
-    except Exception as e:
-        print(f"API failed, using fallback Shiny Pokemon: {e}")
+    """Return the cached roster, or the fallback list if none could be fetched.
+
+    Image URLs point at the local sprite endpoint, which is warmed for the
+    whole roster in the background.
+    """
+    pokemon_list = roster.get()
+    if not pokemon_list:
+        print("Roster unavailable, using fallback Shiny Pokemon")
+        ROSTER_FALLBACK.inc()
         # Fallback to a comprehensive list if API fails - using shiny sprites
-        return [
+        pokemon_list = [
             {'id': 1, 'name': 'Bulbasaur', 'image_url': 'https://raw.githubusercontent.com/PokeAPI/sprites/master/sprites/pokemon/other/official-artwork/shiny/1.png'},
             {'id': 2, 'name': 'Ivysaur', 'image_url': 'https://raw.githubusercontent.com/PokeAPI/sprites/master/sprites/pokemon/other/official-artwork/shiny/2.png'},
             {'id': 3, 'name': 'Venusaur', 'image_url': 'https://raw.githubusercontent.com/PokeAPI/sprites/master/sprites/pokemon/other/official-artwork/shiny/3.png'},
@@ -91,139 +175,405 @@ def get_all_pokemon():
             {'id': 40, 'name': 'Wigglytuff', 'image_url': 'https://raw.githubusercontent.com/PokeAPI/sprites/master/sprites/pokemon/other/official-artwork/shiny/40.png'},
         ]
 
-def initialize_new_round():
+    sprites.prefetch([pokemon['id'] for pokemon in pokemon_list])
+    return [dict(pokemon, image_url=url_for('get_sprite', pokemon_id=pokemon['id'])) for pokemon in pokemon_list]
+
+def initialize_new_round(tournament, round_number, pokemon):
     """Initialize a new round with Pokemon"""
-    game_state = load_game_state()
-    
-    if game_state['current_round'] == 1:
-        # First round: get all Pokemon and shuffle them
-        all_pokemon = get_all_pokemon()
-        random.shuffle(all_pokemon)
-        game_state['current_pokemon'] = all_pokemon
-    else:
-        # Subsequent rounds: use winners from previous round
-        game_state['current_pokemon'] = game_state['winners'].copy()
-        random.shuffle(game_state['current_pokemon'])
-    
-    game_state['winners'] = []
-    game_state['game_history'].append({
-        'round': game_state['current_round'],
-        'total_pokemon': len(game_state['current_pokemon']),
+    pokemon = list(pokemon)
+    random.shuffle(pokemon)
+    tournament.append({
+        'op': 'start_round',
+        'round': round_number,
+        'pokemon': pokemon,
+        'started_at': datetime.now().isoformat()
+    })
+    return tournament.state
+
+def start_ranking(tournament, pokemon):
+    """Start a full ranking of pokemon in a random initial order"""
+    pokemon = list(pokemon)
+    random.shuffle(pokemon)
+    tournament.append({
+        'op': 'start_ranking',
+        'pokemon': pokemon,
         'started_at': datetime.now().isoformat()
     })
-    
-    save_game_state(game_state)
-    return game_state
+    return tournament.state
+
+def tournament_started(game_state):
+    return bool(game_state['current_pokemon'] or game_state['winners'])
+
+def remaining_matches(game_state):
+    if game_state.get('mode') == 'ranking':
+        return ranking.remaining_comparisons(game_state)
+    return len(game_state['current_pokemon']) // 2
+
+def upcoming_matches(game_state, count):
+    """The next count pairs of the current round, in the order they are played.
+
+    In ranking mode only the next pair is known.
+    """
+    pokemon = game_state['current_pokemon']
+    return [
+        {'pokemon1': pokemon[i], 'pokemon2': pokemon[i + 1]}
+        for i in range(0, min(len(pokemon) - 1, 2 * count), 2)
+    ]
 
 @app.route('/')
 def index():
-    game_state = load_game_state()
-    
-    # Initialize first round if needed
-    if not game_state['current_pokemon'] and not game_state['winners']:
-        game_state = initialize_new_round()
-    
-    return render_template('pokemon_tournament.html', game_state=game_state)
+    with current_tournament() as tournament:
+        started = tournament_started(tournament.state)
+
+    # Initialize first round if needed, fetching the roster without the lock
+    if not started:
+        all_pokemon = get_all_pokemon()
+        with current_tournament() as tournament:
+            if not tournament_started(tournament.state):
+                initialize_new_round(tournament, 1, all_pokemon)
+
+    with current_tournament() as tournament:
+        game_state = copy.deepcopy(tournament.state)
+
+    with TEMPLATE_RENDER_SECONDS.time(template='pokemon_tournament.html'):
+        return render_template('pokemon_tournament.html', game_state=game_state)
 
 @app.route('/api/current-match')
 def get_current_match():
-    game_state = load_game_state()
-    
-    if len(game_state['current_pokemon']) < 2:
-        return jsonify({'error': 'Not enough Pokemon for a match'}), 404
-    
-    # Return the first two Pokemon for the current match
-    return jsonify({
-        'pokemon1': game_state['current_pokemon'][0],
-        'pokemon2': game_state['current_pokemon'][1],
-        'remaining_matches': len(game_state['current_pokemon']) // 2,
-        'current_round': game_state['current_round']
-    })
+    with current_tournament() as tournament:
+        game_state = tournament.state
+
+        if len(game_state['current_pokemon']) < 2:
+            return jsonify({'error': 'Not enough Pokemon for a match'}), 404
+
+        # Return the first two Pokemon for the current match
+        return jsonify({
+            'pokemon1': game_state['current_pokemon'][0],
+            'pokemon2': game_state['current_pokemon'][1],
+            'remaining_matches': remaining_matches(game_state),
+            'current_round': game_state['current_round']
+        })
 
 @app.route('/api/choose-pokemon', methods=['POST'])
 def choose_pokemon():
-    game_state = load_game_state()
-    
-    if len(game_state['current_pokemon']) < 2:
-        return jsonify({'error': 'Not enough Pokemon for a match'}), 404
-    
     data = request.get_json()
     choice = data.get('choice')  # 'pokemon1' or 'pokemon2'
-    
-    if choice not in ['pokemon1', 'pokemon2']:
-        return jsonify({'error': 'Invalid choice'}), 400
-    
-    # Get the chosen Pokemon and remove both from current list
-    if choice == 'pokemon1':
-        winner = game_state['current_pokemon'][0]
-        loser = game_state['current_pokemon'][1]
-    else:
-        winner = game_state['current_pokemon'][1]
-        loser = game_state['current_pokemon'][0]
-    
-    # Remove both Pokemon from current list
-    game_state['current_pokemon'] = game_state['current_pokemon'][2:]
-    
-    # Add winner to winners list
-    game_state['winners'].append(winner)
-    
-    save_game_state(game_state)
-    
-    return jsonify({
-        'message': f'{winner["name"]} wins! {loser["name"]} is eliminated.',
-        'winner': winner,
-        'loser': loser,
-        'remaining_matches': len(game_state['current_pokemon']) // 2,
-        'winners_count': len(game_state['winners']),
-        'current_round': game_state['current_round']
-    })
+
+    with current_tournament() as tournament:
+        game_state = tournament.state
+
+        if len(game_state['current_pokemon']) < 2:
+            return jsonify({'error': 'Not enough Pokemon for a match'}), 404
+
+        if choice not in ['pokemon1', 'pokemon2']:
+            return jsonify({'error': 'Invalid choice'}), 400
+
+        # Remove both Pokemon from the current list and advance the winner
+        winner, loser = tournament.append({'op': 'vote', 'choice': choice})
+        ratings.record([(winner, loser)], tournament.id)
+
+        return jsonify({
+            'message': f'{winner["name"]} wins! {loser["name"]} is eliminated.',
+            'winner': winner,
+            'loser': loser,
+            'remaining_matches': remaining_matches(game_state),
+            'winners_count': len(game_state['winners']),
+            'current_round': game_state['current_round']
+        })
+
+@app.route('/api/upcoming-matches')
+def get_upcoming_matches():
+    count = request.args.get('count', 10, type=int)
+    if count < 1:
+        return jsonify({'error': 'count must be a positive integer'}), 400
+    count = min(count, MAX_BATCH_MATCHES)
+
+    with current_tournament() as tournament:
+        game_state = tournament.state
+
+        if len(game_state['current_pokemon']) < 2:
+            return jsonify({'error': 'Not enough Pokemon for a match'}), 404
+
+        return jsonify({
+            'matches': upcoming_matches(game_state, count),
+            'remaining_matches': remaining_matches(game_state),
+            'current_round': game_state['current_round']
+        })
+
+@app.route('/api/choose-pokemon-batch', methods=['POST'])
+def choose_pokemon_batch():
+    """Apply an ordered batch of votes in one state update.
+
+    Each vote is {'choice', 'key', 'pokemon1_id', 'pokemon2_id'}; all but
+    'choice' are optional.  Votes whose key was already applied are skipped,
+    so a retried batch is safe.  The ids pin a vote to the match the client
+    saw, and the batch stops at the first vote that does not fit.  Pass
+    'upcoming': N to get the next N pairs back in the same response.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Send a JSON object'}), 400
+    votes = data.get('votes', [])
+    count = data.get('upcoming', 0)
+
+    if (not isinstance(votes, list) or len(votes) > MAX_BATCH_MATCHES
+            or not all(isinstance(vote, dict) for vote in votes)):
+        return jsonify({'error': f'Send a list of at most {MAX_BATCH_MATCHES} votes'}), 400
+    if not all(isinstance(vote.get('key'), (str, type(None))) for vote in votes):
+        return jsonify({'error': 'Vote keys must be strings'}), 400
+    if not isinstance(count, int) or isinstance(count, bool) or count < 0:
+        return jsonify({'error': 'upcoming must be a non-negative integer'}), 400
+    count = min(count, MAX_BATCH_MATCHES)
+
+    with current_tournament() as tournament:
+        game_state = tournament.state
+        pokemon = game_state['current_pokemon']
+        seen_keys = set(game_state.get('recent_vote_keys', []))
+        results = []
+        choices = []
+        keys = []
+        error = None
+
+        for vote in votes:
+            key = vote.get('key')
+            if key is not None and key in seen_keys:
+                results.append({'key': key, 'duplicate': True})
+                continue
+            position = 2 * len(choices)
+            if position and game_state.get('mode') == 'ranking':
+                error = ('In ranking mode each match depends on the previous vote', 409)
+                break
+            if len(pokemon) - position < 2:
+                error = ('Not enough Pokemon for a match', 404)
+                break
+            if vote.get('choice') not in ['pokemon1', 'pokemon2']:
+                error = ('Invalid choice', 400)
+                break
+            pokemon1_id = pokemon[position]['id']
+            pokemon2_id = pokemon[position + 1]['id']
+            if (vote.get('pokemon1_id', pokemon1_id) != pokemon1_id
+                    or vote.get('pokemon2_id', pokemon2_id) != pokemon2_id):
+                error = ('Vote does not match the current match', 409)
+                break
+            results.append({'key': key})
+            choices.append(vote['choice'])
+            keys.append(key)
+            if key is not None:
+                seen_keys.add(key)
+
+        if choices:
+            outcomes = tournament.append({'op': 'votes', 'choices': choices, 'keys': keys})
+            ratings.record(outcomes, tournament.id)
+            outcomes = iter(outcomes)
+            for result in results:
+                if not result.get('duplicate'):
+                    result['winner'], result['loser'] = next(outcomes)
+
+        response = {
+            'results': results,
+            'applied': len(choices),
+            'matches': upcoming_matches(game_state, count),
+            'remaining_matches': remaining_matches(game_state),
+            'winners_count': len(game_state['winners']),
+            'current_round': game_state['current_round']
+        }
+        if error:
+            response['error'], status = error
+            return jsonify(response), status
+        return jsonify(response)
 
 @app.route('/api/next-round', methods=['POST'])
 def next_round():
-    game_state = load_game_state()
-    # If one unpaired Pokemon remains, auto-advance it
-    if len(game_state['current_pokemon']) == 1:
-        game_state['winners'].append(game_state['current_pokemon'][0])
-        game_state['current_pokemon'] = []
-        save_game_state(game_state)
-    if game_state['current_pokemon']:
-        return jsonify({'error': 'Current round not finished'}), 400
-    if len(game_state['winners']) < 2:
-        return jsonify({'error': 'Not enough winners to continue'}), 400
-    # Start new round
-    game_state['current_round'] += 1
-    save_game_state(game_state)  # Save incremented round
-    game_state = initialize_new_round()
-    return jsonify({
-        'message': f'Round {game_state["current_round"]} started!',
-        'pokemon_count': len(game_state['current_pokemon']),
-        'current_round': game_state['current_round']
-    })
+    with current_tournament() as tournament:
+        game_state = tournament.state
+        # If one unpaired Pokemon remains, auto-advance it
+        if len(game_state['current_pokemon']) == 1:
+            tournament.append({'op': 'bye'})
+        if game_state['current_pokemon']:
+            return jsonify({'error': 'Current round not finished'}), 400
+        if len(game_state['winners']) < 2:
+            return jsonify({'error': 'Not enough winners to continue'}), 400
+        # Start new round
+        game_state = initialize_new_round(tournament, game_state['current_round'] + 1, game_state['winners'])
+        return jsonify({
+            'message': f'Round {game_state["current_round"]} started!',
+            'pokemon_count': len(game_state['current_pokemon']),
+            'current_round': game_state['current_round']
+        })
 
 @app.route('/api/reset-game', methods=['POST'])
 def reset_game():
-    # Reset game state
-    game_state = {
-        'current_round': 1,
-        'current_pokemon': [],
-        'winners': [],
-        'game_history': []
-    }
-    save_game_state(game_state)
-    
-    # Initialize new game
-    game_state = initialize_new_round()
-    
-    return jsonify({
-        'message': 'Game reset! New tournament started.',
-        'pokemon_count': len(game_state['current_pokemon']),
-        'current_round': game_state['current_round']
-    })
+    # 'bracket' (default) crowns a champion; 'ranking' orders every Pokemon
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Send a JSON object'}), 400
+    mode = data.get('mode', 'bracket')
+    if mode not in ['bracket', 'ranking']:
+        return jsonify({'error': 'Invalid mode'}), 400
+
+    all_pokemon = get_all_pokemon()
+
+    with current_tournament() as tournament:
+        # Reset game state
+        tournament.append({'op': 'reset'})
+
+        # Initialize new game
+        if mode == 'ranking':
+            game_state = start_ranking(tournament, all_pokemon)
+        else:
+            game_state = initialize_new_round(tournament, 1, all_pokemon)
+
+        return jsonify({
+            'message': 'Game reset! New tournament started.',
+            'mode': mode,
+            'pokemon_count': len(all_pokemon),
+            'remaining_matches': remaining_matches(game_state),
+            'current_round': game_state['current_round']
+        })
+
+@app.route('/api/ranking')
+def get_ranking():
+    with current_tournament() as tournament:
+        game_state = tournament.state
+
+        if game_state.get('mode') != 'ranking':
+            return jsonify({'error': 'This tournament is not in ranking mode'}), 404
+
+        return jsonify({
+            'ranking': game_state['ranking']['result'],
+            'comparisons': len(game_state['ranking']['comparisons']),
+            'remaining_matches': remaining_matches(game_state)
+        })
+
+def spectated_tournament():
+    """Lock and return the tournament named by ?tournament=<id>, or this session's own"""
+    tournament_id = request.args.get('tournament')
+    if tournament_id:
+        return store.tournament(tournament_id, create=False)
+    return current_tournament()
 
 @app.route('/api/game-state')
 def get_game_state():
-    game_state = load_game_state()
-    return jsonify(game_state)
+    """Full state, or with ?since=<version> only the events after that version.
+
+    Falls back to the full state when the events are no longer kept.
+    """
+    since = request.args.get('since', type=int)
+
+    try:
+        with spectated_tournament() as tournament:
+            etag = f'{tournament.id}-{tournament.seq}'
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+
+            changes = tournament.changes_since(since) if since is not None else None
+            if changes is not None:
+                response = jsonify({
+                    'version': tournament.seq,
+                    'since': since,
+                    'events': [dict(event, version=entry.seq) for entry in changes for event in entry.events]
+                })
+            else:
+                response = jsonify(dict(tournament.state, version=tournament.seq, tournament_id=tournament.id))
+    except KeyError:
+        return jsonify({'error': 'Unknown tournament'}), 404
+
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/api/game-state/stream')
+def stream_game_state():
+    """Server-Sent Events stream of state changes for spectators.
+
+    Each update carries the same events as a ?since delta.  A 'resync'
+    event means the spectator fell too far behind and should reload the
+    full state.
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+
+    try:
+        with spectated_tournament() as tournament:
+            tournament.spectators += 1
+            version = tournament.seq if since is None else since
+    except KeyError:
+        return jsonify({'error': 'Unknown tournament'}), 404
+
+    def events():
+        last_version = version
+        try:
+            yield f'retry: {SSE_RETRY_MS}\n\n'
+            while True:
+                with tournament.changed:
+                    changes = tournament.changes_since(last_version)
+                    if changes == []:
+                        tournament.changed.wait(SSE_KEEPALIVE)
+                        changes = tournament.changes_since(last_version)
+                if changes is None:
+                    last_version = tournament.seq
+                    yield f'event: resync\ndata: {json.dumps({"version": last_version})}\n\n'
+                elif not changes:
+                    yield ': keepalive\n\n'
+                else:
+                    for entry in changes:
+                        yield f'id: {entry.seq}\nevent: update\ndata: {entry.message}\n\n'
+                    last_version = changes[-1].seq
+        finally:
+            with tournament.lock:
+                tournament.spectators -= 1
+
+    return app.response_class(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/leaderboard')
+def get_leaderboard():
+    version, body = ratings.leaderboard()
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(version)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/sprites/<int:pokemon_id>.png')
+@app.route('/sprites/<int:pokemon_id>-<int:size>.png')
+def get_sprite(pokemon_id, size=None):
+    if size is not None and size not in SPRITE_SIZES:
+        return jsonify({'error': 'Unknown sprite size'}), 404
+
+    # Only Pokemon on the roster are ever fetched from upstream
+    roster_ids = roster.ids()
+    if roster_ids is not None and pokemon_id not in roster_ids:
+        return jsonify({'error': 'Unknown Pokemon'}), 404
+
+    cached = sprites.get(pokemon_id, size, fetch=roster_ids is not None)
+    if cached is None:
+        # Let the browser load the artwork directly rather than show nothing
+        return redirect(UPSTREAM_URL.format(pokemon_id=pokemon_id))
+
+    path, etag = cached
+    response = send_file(path, mimetype='image/png', etag=etag, max_age=SPRITE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/api/prefetch-sprites', methods=['POST'])
+def prefetch_sprites():
+    # get_all_pokemon() queues the whole roster for download
+    queued = sprites.prefetch([pokemon['id'] for pokemon in get_all_pokemon()])
+    return jsonify({
+        'message': f'{queued} sprites queued for download',
+        'queued': queued
+    })
+
+@app.route('/metrics')
+def get_metrics():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,436 @@
+"""Load-generation and latency benchmark for the tournament API.
+
+Simulates concurrent voters each playing full bracket tournaments against the
+real routes, either in-process through the Flask test client or over HTTP
+against a local threaded server.  The app runs in a scratch directory with a
+generated roster, so no network access is needed and no local state is
+touched.
+
+Reports throughput, p50/p95/p99 latency per route, journal and disk bytes
+written per vote and any lost, duplicated or missing votes, then checks that votes survive a
+snapshot and restarts of the state store.  Results can be saved as a JSON
+baseline and later runs compared against it:
+
+    python benchmark.py --save-baseline bench_baseline.json
+    python benchmark.py --baseline bench_baseline.json   # exit code 1 on regression
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Relative increase that counts as a regression against the baseline
+DEFAULT_TOLERANCE = 0.25
+
+# Routes hit fewer times than this are too noisy to compare latencies on
+MIN_SAMPLES = 50
+
+# Rejected vote requests in a row after which a voter abandons its game
+MAX_FAILED_VOTES = 3
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not samples:
+        return None
+    index = max(0, min(len(samples) - 1, int(round(fraction * len(samples))) - 1))
+    return samples[index]
+
+
+def disk_write_bytes():
+    """Bytes this process has written to files so far, or None (Linux only).
+
+    Counts every file the app writes (journal, SQLite databases and their
+    WALs) but not sockets, so server mode measures the same thing as the
+    test client.  Filesystems without block I/O accounting, such as tmpfs,
+    report nothing.
+    """
+    counters = {}
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                name, value = line.split(':')
+                counters[name] = int(value)
+    except OSError:
+        return None
+    if 'write_bytes' not in counters:
+        return None
+    return counters['write_bytes'] - counters.get('cancelled_write_bytes', 0)
+
+
+def load_app(workdir, pokemon_count):
+    """Import app.py inside workdir with a generated roster"""
+    roster_path = os.path.join(workdir, 'roster.json')
+    with open(roster_path, 'w') as f:
+        json.dump([
+            {'id': i, 'name': f'Pokemon {i}', 'image_url': f'/sprites/{i}.png'}
+            for i in range(1, pokemon_count + 1)
+        ], f)
+    os.environ['ROSTER_SOURCE_FILE'] = roster_path
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+    # Sprites are not part of the vote path; keep the run offline
+    app_module.sprites.prefetch = lambda pokemon_ids: 0
+    return app_module
+
+
+class TestClientTransport:
+    def __init__(self, app_module):
+        self.client = app_module.app.test_client()
+
+    def request(self, method, path, payload=None):
+        response = self.client.open(path, method=method, json=payload)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HTTPTransport:
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def request(self, method, path, payload=None):
+        response = self.session.request(method, self.base_url + path, json=payload)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body
+
+
+def recorded_votes(game_state):
+    """Votes applied to a tournament's state since its last reset"""
+    return sum(entry.get('votes', 0) for entry in game_state['game_history'])
+
+
+class Voter:
+    """Plays full tournaments and records per-route latencies"""
+
+    def __init__(self, transport, batch_size):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.latencies = {}
+        # Votes acknowledged in the last game played in each tournament
+        self.last_games = {}
+        self.votes = 0
+        self.lost = 0
+        self.duplicated = 0
+        self.errors = 0
+        self.failed_votes = 0
+
+    def call(self, method, route, path=None, payload=None):
+        start = time.perf_counter()
+        status, body = self.transport.request(method, path or route, payload)
+        self.latencies.setdefault(route, []).append(time.perf_counter() - start)
+        if status >= 500:
+            self.errors += 1
+        return status, body
+
+    def play(self, tournaments):
+        self.call('GET', '/')
+        for _ in range(tournaments):
+            self.call('POST', '/api/reset-game')
+            _, state = self.call('GET', '/api/game-state')
+            tournament_id = state['tournament_id']
+            votes = 0
+            failures = 0
+            while failures < MAX_FAILED_VOTES:
+                if self.batch_size > 1:
+                    cast = self.vote_batch()
+                else:
+                    cast = self.vote_one()
+                if cast is None:
+                    status, _ = self.call('POST', '/api/next-round')
+                    if status != 200:
+                        break
+                    continue
+                if cast:
+                    failures = 0
+                else:
+                    failures += 1
+                    self.failed_votes += 1
+                votes += cast
+            self.votes += votes
+            self.last_games[tournament_id] = votes
+
+            # Every acknowledged vote must be in the tournament's state exactly once
+            _, state = self.call('GET', '/api/game-state')
+            recorded = recorded_votes(state)
+            self.lost += max(0, votes - recorded)
+            self.duplicated += max(0, recorded - votes)
+
+    def vote_one(self):
+        status, match = self.call('GET', '/api/current-match')
+        if status != 200:
+            return None
+        choice = 'pokemon1' if match['pokemon1']['id'] < match['pokemon2']['id'] else 'pokemon2'
+        status, _ = self.call('POST', '/api/choose-pokemon', payload={'choice': choice})
+        return 1 if status == 200 else 0
+
+    def vote_batch(self):
+        status, data = self.call('GET', '/api/upcoming-matches',
+                                 f'/api/upcoming-matches?count={self.batch_size}')
+        if status != 200:
+            return None
+        votes = [{
+            'key': f'{time.perf_counter_ns()}-{i}',
+            'choice': 'pokemon1' if match['pokemon1']['id'] < match['pokemon2']['id'] else 'pokemon2',
+            'pokemon1_id': match['pokemon1']['id'],
+            'pokemon2_id': match['pokemon2']['id']
+        } for i, match in enumerate(data['matches'])]
+        status, result = self.call('POST', '/api/choose-pokemon-batch', payload={'votes': votes})
+        return result['applied'] if status == 200 else 0
+
+
+def run(app_module, transport_factory, voters, tournaments, batch_size, pokemon_count):
+    players = [Voter(transport_factory(), batch_size) for _ in range(voters)]
+    journal_before = app_module.store.journal_bytes
+    disk_before = disk_write_bytes()
+    threads = [threading.Thread(target=player.play, args=(tournaments,)) for player in players]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    # Count the rating writes these votes queued too
+    app_module.ratings.flush()
+    disk_after = disk_write_bytes()
+
+    expected = voters * tournaments * (pokemon_count - 1)
+    votes = sum(player.votes for player in players)
+    last_games = {}
+    for player in players:
+        last_games.update(player.last_games)
+
+    routes = {}
+    for player in players:
+        for route, samples in player.latencies.items():
+            routes.setdefault(route, []).extend(samples)
+    requests_made = sum(len(samples) for samples in routes.values())
+    for route, samples in routes.items():
+        samples.sort()
+        routes[route] = {
+            'count': len(samples),
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 3)
+        }
+
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'requests': requests_made,
+        'requests_per_s': round(requests_made / elapsed, 1),
+        'votes': votes,
+        'votes_per_s': round(votes / elapsed, 1),
+        'expected_votes': expected,
+        'lost_votes': sum(player.lost for player in players),
+        'duplicated_votes': sum(player.duplicated for player in players),
+        'server_errors': sum(player.errors for player in players),
+        'failed_votes': sum(player.failed_votes for player in players),
+        'journal_bytes_per_vote': round((app_module.store.journal_bytes - journal_before) / max(votes, 1), 1),
+        'disk_write_bytes_per_vote': (
+            round((disk_after - disk_before) / max(votes, 1), 1)
+            if disk_before is not None and disk_after - disk_before > 0 else None
+        ),
+        'routes': routes
+    }, last_games
+
+
+def check_recovered(app_module, results, last_games):
+    """Reopen the state store and count each mode's votes lost or duplicated on the way.
+
+    Compares the last game of every tournament against what recovery
+    rebuilds from SQLite and the journal; app_module.store is replaced by
+    the reopened store.
+    """
+    app_module.store.close()
+    store = app_module.store = app_module.TournamentStore(
+        app_module.TOURNAMENT_DB_FILE, app_module.GAME_JOURNAL_FILE)
+    for mode, games in last_games.items():
+        lost = duplicated = 0
+        for tournament_id, votes in games.items():
+            try:
+                with store.tournament(tournament_id, create=False) as tournament:
+                    recorded = recorded_votes(tournament.state)
+            except KeyError:
+                recorded = 0
+            lost += max(0, votes - recorded)
+            duplicated += max(0, recorded - votes)
+        results['modes'][mode]['lost_after_restart'] = lost
+        results['modes'][mode]['duplicated_after_restart'] = duplicated
+
+
+def check_restart(app_module):
+    """Vote across a snapshot and two restarts; return what did not survive.
+
+    Closes app_module.store; the app cannot serve requests afterwards.
+    """
+    pokemon = [{'id': i, 'name': f'Pokemon {i}'} for i in range(1, 5)]
+    store = app_module.store
+    with store.tournament('restart-check') as tournament:
+        tournament.append({'op': 'start_round', 'round': 1, 'pokemon': pokemon, 'started_at': ''})
+        tournament.append({'op': 'vote', 'choice': 'pokemon1'})
+    store.snapshot()
+    store.close()
+
+    store = app_module.TournamentStore(app_module.TOURNAMENT_DB_FILE, app_module.GAME_JOURNAL_FILE)
+    with store.tournament('restart-check') as tournament:
+        before = tournament.seq
+        tournament.append({'op': 'vote', 'choice': 'pokemon1'})
+        after = tournament.seq
+    store.close()
+
+    store = app_module.TournamentStore(app_module.TOURNAMENT_DB_FILE, app_module.GAME_JOURNAL_FILE)
+    with store.tournament('restart-check') as tournament:
+        recovered = tournament.seq
+        winners = len(tournament.state['winners'])
+    store.close()
+
+    errors = []
+    if after <= before:
+        errors.append(f'version went from {before} to {after} after a restart')
+    if recovered != after:
+        errors.append(f'version {after} recovered as {recovered}')
+    if winners != 2:
+        errors.append(f'{2 - winners} of 2 votes lost across restarts')
+    return errors
+
+
+def start_server(app_module):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def compare(results, baseline, tolerance):
+    """Return human-readable regressions of results against baseline"""
+    regressions = [f'restart: {error}' for error in results['restart_errors']]
+    for mode, result in results['modes'].items():
+        base = baseline.get('modes', {}).get(mode)
+        if (result['lost_votes'] or result['duplicated_votes'] or result['server_errors']
+                or result['failed_votes']):
+            regressions.append(
+                f"{mode}: {result['lost_votes']} lost, {result['duplicated_votes']} duplicated votes, "
+                f"{result['failed_votes']} failed votes, {result['server_errors']} server errors"
+            )
+        if result['votes'] != result['expected_votes']:
+            regressions.append(f"{mode}: {result['votes']} of {result['expected_votes']} expected votes cast")
+        if result['lost_after_restart'] or result['duplicated_after_restart']:
+            regressions.append(
+                f"{mode}: {result['lost_after_restart']} lost, "
+                f"{result['duplicated_after_restart']} duplicated votes after a restart"
+            )
+        if base is None:
+            continue
+        if result['votes_per_s'] < base['votes_per_s'] * (1 - tolerance):
+            regressions.append(f"{mode}: votes/s {base['votes_per_s']} -> {result['votes_per_s']}")
+        for metric in ('journal_bytes_per_vote', 'disk_write_bytes_per_vote'):
+            if result.get(metric) is None or base.get(metric) is None:
+                continue
+            if result[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{mode}: {metric} {base[metric]} -> {result[metric]}")
+        for route, stats in result['routes'].items():
+            base_stats = base['routes'].get(route)
+            if not base_stats or min(stats['count'], base_stats['count']) < MIN_SAMPLES:
+                continue
+            if stats['p95_ms'] > base_stats['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{mode} {route}: p95 {base_stats['p95_ms']}ms -> {stats['p95_ms']}ms")
+    return regressions
+
+
+def print_summary(results):
+    for mode, result in results['modes'].items():
+        print(f"\n[{mode}] {result['votes']} votes in {result['elapsed_s']}s: "
+              f"{result['votes_per_s']} votes/s, {result['requests_per_s']} requests/s")
+        print(f"  journal bytes/vote: {result['journal_bytes_per_vote']}, "
+              f"disk write bytes/vote: {result['disk_write_bytes_per_vote']}")
+        print(f"  lost votes: {result['lost_votes']}, duplicated votes: {result['duplicated_votes']}, "
+              f"failed votes: {result['failed_votes']}, server errors: {result['server_errors']}")
+        print(f"  after a restart: {result['lost_after_restart']} lost, "
+              f"{result['duplicated_after_restart']} duplicated")
+        for route, stats in sorted(result['routes'].items()):
+            print(f"  {route:<28} n={stats['count']:<6} p50={stats['p50_ms']:.2f}ms "
+                  f"p95={stats['p95_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms")
+    print(f"\nrestart after snapshot: {'; '.join(results['restart_errors']) or 'ok'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--voters', type=int, default=8, help='concurrent voters')
+    parser.add_argument('--tournaments', type=int, default=2, help='full tournaments per voter')
+    parser.add_argument('--pokemon', type=int, default=151, help='entrants per tournament')
+    parser.add_argument('--batch', type=int, default=1,
+                        help='votes per request; above 1 uses the batch endpoints')
+    parser.add_argument('--mode', choices=['test-client', 'server', 'both'], default='both')
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--save-baseline', help='write results JSON as the new baseline')
+    parser.add_argument('--baseline', help='compare against this baseline JSON')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+    for name in ('output', 'save_baseline', 'baseline'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='pokemon-bench-') as workdir:
+        app_module = load_app(workdir, args.pokemon)
+        results = {
+            'config': {
+                'voters': args.voters,
+                'tournaments': args.tournaments,
+                'pokemon': args.pokemon,
+                'batch': args.batch
+            },
+            'modes': {}
+        }
+        last_games = {}
+        if args.mode in ('test-client', 'both'):
+            results['modes']['test-client'], last_games['test-client'] = run(
+                app_module, lambda: TestClientTransport(app_module),
+                args.voters, args.tournaments, args.batch, args.pokemon
+            )
+        if args.mode in ('server', 'both'):
+            server = start_server(app_module)
+            base_url = f'http://127.0.0.1:{server.server_port}'
+            try:
+                results['modes']['server'], last_games['server'] = run(
+                    app_module, lambda: HTTPTransport(base_url),
+                    args.voters, args.tournaments, args.batch, args.pokemon
+                )
+            finally:
+                server.shutdown()
+        check_recovered(app_module, results, last_games)
+        results['restart_errors'] = check_restart(app_module)
+        os.chdir(cwd)
+
+    print_summary(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != results['config']:
+            print(f"\nWarning: baseline config {baseline.get('config')} differs from this run")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('\nRegressions against baseline:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print('\nNo regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
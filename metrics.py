@@ -0,0 +1,169 @@
+"""Low-overhead counters, gauges and histograms in Prometheus text format.
+
+Metrics are declared once at module level next to the code they measure and
+rendered together by ``render()`` for the ``/metrics`` endpoint.  A
+histogram's ``time()`` block also adds its duration to the current request's
+Server-Timing breakdown when one is being collected (see
+``start_request_timing()``).
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+import contextvars
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+_timings = contextvars.ContextVar('server_timings', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labels:
+            items = [((), 0)]
+        return self._header() + [
+            f'{self.name}{_format_labels(self.labels, key)} {value}' for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """A value that is set, or read from callback() at scrape time.
+
+    callback returns a number, or a dict of label value tuples to numbers.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self.callback is not None:
+            values = self.callback()
+            items = sorted(values.items()) if isinstance(values, dict) else [((), values)]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return self._header() + [
+            f'{self.name}{_format_labels(self.labels, key)} {value}' for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, timing_name=None):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # Name of this phase in the Server-Timing header, if it appears there
+        self.timing_name = timing_name
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(elapsed, **labels)
+            record_timing(self.timing_name, elapsed)
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        lines = self._header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, [('le', bound)])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+def render():
+    """All registered metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def start_request_timing():
+    """Start collecting Server-Timing phases in this context; returns a reset token"""
+    return _timings.set({})
+
+
+def stop_request_timing(token):
+    _timings.reset(token)
+
+
+def record_timing(name, seconds):
+    timings = _timings.get()
+    if timings is not None and name:
+        timings[name] = timings.get(name, 0) + seconds
+
+
+def server_timing_header():
+    """Server-Timing header value for the phases recorded so far, or None"""
+    timings = _timings.get()
+    if not timings:
+        return None
+    return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings.items())
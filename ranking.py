@@ -0,0 +1,109 @@
+"""Full ranking mode: order every entrant with as few votes as possible.
+
+The order is found with Ford-Johnson merge-insertion sort, which needs close
+to the information-theoretic minimum of log2(n!) comparisons.  Votes are
+the comparisons.  Rather than keeping a suspended sort around, the game
+state stores the shuffled entrants and every answer given so far; the sort
+is replayed against those answers until it asks a question nobody has
+answered yet, and that pair is the next match.  This keeps the state plain
+JSON, so a ranking resumes after a restart exactly where it stopped.
+"""
+import math
+
+
+class NeedComparison(Exception):
+    """Raised by the replay when the sort needs an unanswered comparison"""
+
+    def __init__(self, first, second):
+        super().__init__(first, second)
+        self.pair = (first, second)
+
+
+def insertion_order(count):
+    """Order to insert pend elements 1..count-1 (0 goes first), by Jacobsthal groups"""
+    order = []
+    previous, current = 1, 3
+    while previous < count:
+        order.extend(range(min(current, count), previous, -1))
+        previous, current = current, current + 2 * previous
+    return [i - 1 for i in order]
+
+
+def merge_insertion_sort(items, less):
+    """Sort items ascending using Ford-Johnson merge-insertion"""
+    if len(items) <= 1:
+        return list(items)
+
+    # Compare in pairs and sort the larger element of each pair recursively
+    pairs = {}
+    for first, second in zip(items[0::2], items[1::2]):
+        if less(first, second):
+            pairs[second] = first
+        else:
+            pairs[first] = second
+    chain = merge_insertion_sort(list(pairs), less)
+
+    # pend[i] is known to be smaller than chain[i]; a straggler has no bound
+    pend = [pairs[larger] for larger in chain]
+    bounds = list(chain)
+    if len(items) % 2:
+        pend.append(items[-1])
+        bounds.append(None)
+
+    chain.insert(0, pend[0])
+    for i in insertion_order(len(pend)):
+        item = pend[i]
+        low = 0
+        high = len(chain) if bounds[i] is None else chain.index(bounds[i])
+        while low < high:
+            middle = (low + high) // 2
+            if less(item, chain[middle]):
+                high = middle
+            else:
+                low = middle + 1
+        chain.insert(low, item)
+    return chain
+
+
+def max_comparisons(count):
+    """Worst-case number of comparisons merge-insertion needs for count items"""
+    return sum(math.ceil(math.log2(3 * k / 4)) for k in range(1, count + 1))
+
+
+def replay(entrant_ids, comparisons):
+    """Return (ranking best-first, None) or (None, next pair to compare)"""
+    winners = {}
+    for winner, loser in comparisons:
+        winners[frozenset((winner, loser))] = winner
+
+    def less(first, second):
+        winner = winners.get(frozenset((first, second)))
+        if winner is None:
+            raise NeedComparison(first, second)
+        return winner == second
+
+    try:
+        return merge_insertion_sort(entrant_ids, less)[::-1], None
+    except NeedComparison as e:
+        return None, e.pair
+
+
+def advance(game_state):
+    """Set the next match, or the final ranking, from the recorded answers"""
+    ranking = game_state['ranking']
+    by_id = {pokemon['id']: pokemon for pokemon in ranking['entrants']}
+    order, pair = replay([pokemon['id'] for pokemon in ranking['entrants']], ranking['comparisons'])
+    if pair is not None:
+        game_state['current_pokemon'] = [by_id[pair[0]], by_id[pair[1]]]
+        return
+    ranking['result'] = [by_id[pokemon_id] for pokemon_id in order]
+    game_state['current_pokemon'] = []
+    game_state['winners'] = ranking['result'][:1]
+
+
+def remaining_comparisons(game_state):
+    """Upper bound on the votes still needed to finish the ranking"""
+    ranking = game_state['ranking']
+    if ranking['result'] is not None:
+        return 0
+    return max(max_comparisons(len(ranking['entrants'])) - len(ranking['comparisons']), 1)
@@ -0,0 +1,241 @@
+"""Cross-tournament ratings built from every head-to-head vote.
+
+Each match result is folded into two ratings:
+
+* Elo, updated in memory and in order as votes arrive.
+* Bradley-Terry, refit in the background every ``refit_interval`` seconds.
+  The fit runs on a per-pair win count table that is kept up to date with
+  every vote, so its cost depends on the number of Pokemon, not on how many
+  matches have been recorded.
+
+Votes only touch memory.  A background thread writes the queued results,
+pair counts and changed ratings to SQLite in one transaction every
+``flush_interval`` seconds, so a crash loses at most that much rating
+history; the tournaments themselves are kept by the state store.
+
+The leaderboard is cached and versioned by the number of results it
+reflects, so repeated requests between votes are served from memory.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+ELO_BASE = 1500
+ELO_K = 32
+
+
+def fit_bradley_terry(wins, prior=1.0, max_iter=1000, tol=1e-9):
+    """Fit Bradley-Terry strengths to a wins matrix with the MM algorithm.
+
+    wins[i, j] is how often i beat j.  Every player also gets ``prior`` wins
+    and losses against a virtual player of strength 1, which keeps unbeaten
+    and winless players finite and anchors the scale.
+    """
+    games = wins + wins.T
+    total_wins = wins.sum(axis=1) + prior
+    strengths = np.ones(len(wins))
+    for _ in range(max_iter):
+        pair_sums = strengths[:, None] + strengths[None, :]
+        denominator = (games / pair_sums).sum(axis=1) + 2 * prior / (strengths + 1)
+        updated = total_wins / denominator
+        converged = np.max(np.abs(np.log(updated / strengths))) < tol
+        strengths = updated
+        if converged:
+            break
+    return strengths
+
+
+class RatingEngine:
+    def __init__(self, db_path, refit_interval=60, flush_interval=1):
+        self.db_path = db_path
+        self.refit_interval = refit_interval
+        self.flush_interval = flush_interval
+        # Guards the in-memory ratings; held only for memory updates
+        self._lock = threading.Lock()
+        # Guards the SQLite connection and keeps flushes in order
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(
+            'CREATE TABLE IF NOT EXISTS matches ('
+            ' id INTEGER PRIMARY KEY,'
+            ' tournament_id TEXT,'
+            ' winner_id INTEGER NOT NULL,'
+            ' loser_id INTEGER NOT NULL,'
+            ' played_at REAL NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS pair_counts ('
+            ' winner_id INTEGER NOT NULL,'
+            ' loser_id INTEGER NOT NULL,'
+            ' wins INTEGER NOT NULL,'
+            ' PRIMARY KEY (winner_id, loser_id));'
+            'CREATE TABLE IF NOT EXISTS ratings ('
+            ' pokemon_id INTEGER PRIMARY KEY,'
+            ' name TEXT NOT NULL,'
+            ' image_url TEXT,'
+            ' elo REAL NOT NULL,'
+            ' wins INTEGER NOT NULL,'
+            ' losses INTEGER NOT NULL);'
+        )
+        self._players = {}
+        for row in self._db.execute('SELECT pokemon_id, name, image_url, elo, wins, losses FROM ratings'):
+            self._players[row[0]] = dict(zip(('id', 'name', 'image_url', 'elo', 'wins', 'losses'), row))
+        self._pair_counts = {
+            (winner_id, loser_id): wins
+            for winner_id, loser_id, wins in self._db.execute('SELECT winner_id, loser_id, wins FROM pair_counts')
+        }
+        self._matches = self._db.execute('SELECT COALESCE(MAX(id), 0) FROM matches').fetchone()[0]
+
+        # Results not yet written to SQLite and the players they changed
+        self._pending = []
+        self._changed = set()
+
+        # Bradley-Terry scores by Pokemon id and the match count they reflect
+        self._bradley_terry = {}
+        self._fitted_matches = 0
+        self._leaderboard = None
+
+        self._stop = threading.Event()
+        threading.Thread(target=self._refit_loop, daemon=True).start()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def record(self, outcomes, tournament_id=None):
+        """Update Elo for (winner, loser) results in order and queue them for storage"""
+        if not outcomes:
+            return
+        now = time.time()
+        with self._lock:
+            for winner, loser in outcomes:
+                winner_player = self._player(winner)
+                loser_player = self._player(loser)
+                expected = 1 / (1 + 10 ** ((loser_player['elo'] - winner_player['elo']) / 400))
+                delta = ELO_K * (1 - expected)
+                winner_player['elo'] += delta
+                loser_player['elo'] -= delta
+                winner_player['wins'] += 1
+                loser_player['losses'] += 1
+                pair = (winner_player['id'], loser_player['id'])
+                self._pair_counts[pair] = self._pair_counts.get(pair, 0) + 1
+                self._pending.append((tournament_id, pair[0], pair[1], now))
+                self._changed.update(pair)
+            self._matches += len(outcomes)
+
+    def flush(self):
+        """Write queued results and the ratings they changed to SQLite"""
+        with self._db_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                changed, self._changed = self._changed, set()
+                players = [dict(self._players[pokemon_id]) for pokemon_id in changed]
+            if not pending:
+                return
+            try:
+                self._db.executemany(
+                    'INSERT INTO matches (tournament_id, winner_id, loser_id, played_at) VALUES (?, ?, ?, ?)',
+                    pending
+                )
+                self._db.executemany(
+                    'INSERT INTO pair_counts (winner_id, loser_id, wins) VALUES (?, ?, 1)'
+                    ' ON CONFLICT(winner_id, loser_id) DO UPDATE SET wins = wins + 1',
+                    [(winner_id, loser_id) for _, winner_id, loser_id, _ in pending]
+                )
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO ratings (pokemon_id, name, image_url, elo, wins, losses)'
+                    ' VALUES (:id, :name, :image_url, :elo, :wins, :losses)',
+                    players
+                )
+                self._db.commit()
+            except sqlite3.Error:
+                self._db.rollback()
+                # Keep the results queued, ahead of any that arrived since
+                with self._lock:
+                    self._pending[:0] = pending
+                    self._changed.update(changed)
+                raise
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Writing ratings failed, will retry: {e}")
+
+    def _player(self, pokemon):
+        player = self._players.get(pokemon['id'])
+        if player is None:
+            player = {
+                'id': pokemon['id'],
+                'name': pokemon['name'],
+                'image_url': pokemon.get('image_url'),
+                'elo': ELO_BASE,
+                'wins': 0,
+                'losses': 0
+            }
+            self._players[pokemon['id']] = player
+        return player
+
+    def refit(self):
+        """Refit Bradley-Terry on all recorded matches"""
+        with self._lock:
+            matches = self._matches
+            rows = [(winner_id, loser_id, wins) for (winner_id, loser_id), wins in self._pair_counts.items()]
+        if not rows:
+            return
+
+        counts = np.array(rows, dtype=np.int64)
+        ids, index = np.unique(counts[:, :2], return_inverse=True)
+        index = index.reshape(-1, 2)
+        wins = np.zeros((len(ids), len(ids)))
+        np.add.at(wins, (index[:, 0], index[:, 1]), counts[:, 2])
+
+        # Report on the Elo scale so both columns read alike
+        scores = ELO_BASE + 400 * np.log10(fit_bradley_terry(wins))
+        bradley_terry = dict(zip(ids.tolist(), scores.tolist()))
+        with self._lock:
+            self._bradley_terry = bradley_terry
+            self._fitted_matches = matches
+
+    def _refit_loop(self):
+        while not self._stop.wait(self.refit_interval):
+            if self._fitted_matches == self._matches:
+                continue
+            try:
+                self.refit()
+            except ValueError as e:
+                print(f"Bradley-Terry refit failed: {e}")
+
+    def leaderboard(self):
+        """Return (version, JSON body) of the leaderboard, cached per version"""
+        with self._lock:
+            version = f'{self._matches}-{self._fitted_matches}'
+            if self._leaderboard is not None and self._leaderboard[0] == version:
+                return self._leaderboard
+            players = [dict(player) for player in self._players.values()]
+            bradley_terry = self._bradley_terry
+            matches = self._matches
+            fitted_matches = self._fitted_matches
+
+        for player in players:
+            player['elo'] = round(player['elo'], 1)
+            score = bradley_terry.get(player['id'])
+            player['bradley_terry'] = round(score, 1) if score is not None else None
+        players.sort(key=lambda player: player['elo'], reverse=True)
+
+        body = json.dumps({
+            'version': version,
+            'matches_recorded': matches,
+            'bradley_terry_matches': fitted_matches,
+            'leaderboard': players
+        })
+        with self._lock:
+            self._leaderboard = (version, body)
+        return version, body
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        with self._db_lock:
+            self._db.close()
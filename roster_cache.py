@@ -0,0 +1,135 @@
+"""Cached Pokemon roster with on-disk persistence and background refresh.
+
+The roster is fetched from a pluggable source (PokeAPI in production, a
+local JSON file or any callable in tests), kept in memory and persisted to
+disk so restarts serve it instantly.  Once it is older than ``ttl`` it is
+still served while a single background fetch refreshes it
+(stale-while-revalidate).  Concurrent misses on a cold cache share one fetch,
+and a failed fetch is not retried for ``retry_interval`` seconds so callers
+fall back right away instead of waiting on the network again.
+"""
+import json
+import os
+import threading
+import time
+
+from metrics import Counter, Histogram
+
+ROSTER_FETCH_SECONDS = Histogram(
+    'pokemon_roster_fetch_seconds', 'Fetching the roster from its source', timing_name='roster-fetch')
+ROSTER_FETCH_ERRORS = Counter('pokemon_roster_fetch_errors_total', 'Failed roster fetches')
+
+
+class FileRosterSource:
+    """Roster source reading a JSON list of Pokemon from a local file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+class RosterCache:
+    def __init__(self, source, path, ttl=24 * 60 * 60, retry_interval=60):
+        self.source = source
+        self.path = path
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._roster = None
+        self._ids = None
+        self._fetched_at = 0
+        self._retry_at = 0
+        self._fetching = False
+        self._loaded_from_disk = False
+        self._cond = threading.Condition()
+
+    def get(self):
+        """Return a copy of the roster, or None if none could be fetched"""
+        with self._cond:
+            if not self._loaded_from_disk:
+                self._load_from_disk()
+            now = time.time()
+            if self._roster is not None:
+                if now - self._fetched_at > self.ttl:
+                    self._start_refresh(now, background=True)
+                return list(self._roster)
+            if not self._fetching and now < self._retry_at:
+                return None  # the last fetch failed moments ago
+            leader = self._start_refresh(now, background=False)
+
+        if leader:
+            self._refresh()
+        with self._cond:
+            while self._fetching:
+                self._cond.wait()
+            return list(self._roster) if self._roster is not None else None
+
+    def ids(self):
+        """Return the set of Pokemon ids in the cached roster, or None if there is none yet.
+
+        Never fetches, so it is cheap enough to call on every request.
+        """
+        with self._cond:
+            if self._roster is None:
+                return None
+            if self._ids is None:
+                self._ids = frozenset(pokemon['id'] for pokemon in self._roster)
+            return self._ids
+
+    def warm(self):
+        """Load the roster in the background unless a copy is already on disk"""
+        with self._cond:
+            if not self._loaded_from_disk:
+                self._load_from_disk()
+            if self._roster is None:
+                self._start_refresh(time.time(), background=True)
+
+    def _start_refresh(self, now, background):
+        """Claim the single in-flight fetch; return whether this caller got it"""
+        if self._fetching or now < self._retry_at:
+            return False
+        self._fetching = True
+        if background:
+            threading.Thread(target=self._refresh, daemon=True).start()
+        return True
+
+    def _refresh(self):
+        roster = None
+        try:
+            with ROSTER_FETCH_SECONDS.time():
+                roster = self.source()
+            if not roster:
+                raise ValueError('roster source returned no Pokemon')
+            self._save_to_disk(roster)
+        except Exception as e:
+            ROSTER_FETCH_ERRORS.inc()
+            print(f"Roster refresh failed: {e}")
+        with self._cond:
+            if roster:
+                self._roster = roster
+                self._ids = None
+                self._fetched_at = time.time()
+            else:
+                self._retry_at = time.time() + self.retry_interval
+            self._fetching = False
+            self._cond.notify_all()
+
+    def _load_from_disk(self):
+        self._loaded_from_disk = True
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._roster = data['pokemon']
+            self._fetched_at = data['fetched_at']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable roster cache {self.path}: {e}")
+
+    def _save_to_disk(self, roster):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': time.time(), 'pokemon': roster}, f)
+        os.replace(tmp_path, self.path)
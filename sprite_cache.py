@@ -0,0 +1,141 @@
+"""On-disk cache of Pokemon artwork with pre-sized variants.
+
+Sprites are fetched from the PokeAPI sprite repository once, stored under
+``cache_dir`` and served from local disk from then on.  Each original is
+also resized to the widths in ``SPRITE_SIZES`` so small screens do not
+download full-size artwork.  Files never change once written, which lets the
+routes hand out strong ETags and immutable caching headers.  A sprite that
+could not be fetched is not tried again for ``retry_interval`` seconds.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+import os
+import threading
+import time
+
+from PIL import Image
+import requests
+
+from metrics import Counter, Histogram
+
+UPSTREAM_URL = 'https://raw.githubusercontent.com/PokeAPI/sprites/master/sprites/pokemon/other/official-artwork/shiny/{pokemon_id}.png'
+
+# Widths the split-screen UI shows (see the srcset in pokemon_minimal.js)
+SPRITE_SIZES = (256, 384)
+
+SPRITE_FETCH_SECONDS = Histogram(
+    'pokemon_sprite_fetch_seconds', 'Downloading one sprite from upstream', timing_name='sprite-fetch')
+SPRITE_FETCH_ERRORS = Counter('pokemon_sprite_fetch_errors_total', 'Sprites that could not be cached')
+
+
+class SpriteCache:
+    def __init__(self, cache_dir, upstream_url=UPSTREAM_URL, sizes=SPRITE_SIZES, workers=8,
+                 retry_interval=300):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.upstream_url = upstream_url
+        self.sizes = sizes
+        self.retry_interval = retry_interval
+        os.makedirs(cache_dir, exist_ok=True)
+        self._etags = {}
+        # [lock, users] per sprite being filled; dropped when the last user is done
+        self._key_locks = {}
+        # Pokemon id -> time before which a failed fetch is not retried
+        self._retry_at = {}
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sprites')
+
+    def path(self, pokemon_id, size=None):
+        name = f'{pokemon_id}.png' if size is None else f'{pokemon_id}-{size}.png'
+        return os.path.join(self.cache_dir, name)
+
+    def get(self, pokemon_id, size=None, fetch=True):
+        """Return (path, etag) of a cached sprite, fetching it on a miss.
+
+        Returns None if the sprite is not cached and cannot (or, with
+        fetch=False, may not) be fetched.
+        """
+        path = self.path(pokemon_id, size)
+        if not os.path.exists(path) and not (fetch and self._fill(pokemon_id)):
+            return None
+        return path, self._etag(path)
+
+    def prefetch(self, pokemon_ids):
+        """Fetch sprites in the background; return how many were newly queued"""
+        with self._lock:
+            new_ids = [i for i in pokemon_ids if i not in self._queued]
+            self._queued.update(new_ids)
+        for pokemon_id in new_ids:
+            self._pool.submit(self._fill, pokemon_id)
+        return len(new_ids)
+
+    def _fill(self, pokemon_id):
+        """Download the original and write every variant; return success"""
+        with self._lock:
+            if time.monotonic() < self._retry_at.get(pokemon_id, 0):
+                return False  # failed moments ago
+            key_lock = self._key_locks.setdefault(pokemon_id, [threading.Lock(), 0])
+            key_lock[1] += 1
+        try:
+            return self._fill_locked(pokemon_id, key_lock[0])
+        finally:
+            with self._lock:
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    del self._key_locks[pokemon_id]
+
+    def _fill_locked(self, pokemon_id, key_lock):
+        # Concurrent misses for the same sprite share one download
+        with key_lock:
+            if all(os.path.exists(self.path(pokemon_id, s)) for s in (None,) + tuple(self.sizes)):
+                return True
+            if time.monotonic() < self._retry_at.get(pokemon_id, 0):
+                return False  # the download this caller waited on failed
+            try:
+                original = self._read_or_download(pokemon_id)
+                image = Image.open(io.BytesIO(original))
+                image.load()
+                for size in self.sizes:
+                    if os.path.exists(self.path(pokemon_id, size)):
+                        continue
+                    variant = image.copy()
+                    variant.thumbnail((size, size), Image.LANCZOS)
+                    buffer = io.BytesIO()
+                    variant.save(buffer, format='PNG', optimize=True)
+                    self._write(self.path(pokemon_id, size), buffer.getvalue())
+                with self._lock:
+                    self._retry_at.pop(pokemon_id, None)
+                return True
+            except Exception as e:
+                SPRITE_FETCH_ERRORS.inc()
+                print(f"Failed to cache sprite {pokemon_id}: {e}")
+                with self._lock:
+                    self._queued.discard(pokemon_id)
+                    self._retry_at[pokemon_id] = time.monotonic() + self.retry_interval
+                return False
+
+    def _read_or_download(self, pokemon_id):
+        path = self.path(pokemon_id)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+        with SPRITE_FETCH_SECONDS.time():
+            response = requests.get(self.upstream_url.format(pokemon_id=pokemon_id), timeout=10)
+        response.raise_for_status()
+        self._write(path, response.content)
+        return response.content
+
+    def _write(self, path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _etag(self, path):
+        etag = self._etags.get(path)
+        if etag is None:
+            with open(path, 'rb') as f:
+                etag = hashlib.sha256(f.read()).hexdigest()[:32]
+            self._etags[path] = etag
+        return etag
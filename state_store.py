@@ -0,0 +1,522 @@
+"""Per-session tournament storage: in-memory LRU, SQLite spill and a vote journal.
+
+Every browser session plays its own tournament.  Recently used tournaments
+live in an in-process LRU cache; tournaments that fall out of it (too many
+hot entries, or idle for too long) are spilled to a local SQLite database and
+loaded back on their next request.  A vote only ever locks and touches its
+own tournament: requests only drop already-saved tournaments from the head
+of the LRU, while a background thread writes out idle ones.
+
+Every change is also written as one small JSON line to a shared append-only
+journal and fsync'd before the request returns, so recording a vote costs a
+few dozen bytes instead of re-dumping a bracket.  Every ``snapshot_every``
+records a background thread writes the dirty hot tournaments to SQLite and
+trims the journal down to the records SQLite does not cover yet.  On startup
+the journal is replayed on top of what SQLite holds.
+
+The cache lives in the memory of a single process, so run the app as one
+(threaded) process per database.
+"""
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from itertools import takewhile
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import Counter, Histogram
+import ranking
+
+# Idempotency keys of recent batched votes remembered per tournament
+RECENT_VOTE_KEYS = 512
+
+# Memory for recent events kept per tournament to answer delta polls and
+# spectators, estimated as a fixed cost per event plus one per Pokemon id
+FEED_BYTES = 8 * 1024
+EVENT_BYTES = 320
+POKEMON_ID_BYTES = 8
+
+STATE_LOAD_SECONDS = Histogram(
+    'pokemon_state_load_seconds', 'Loading and parsing a spilled tournament from SQLite',
+    timing_name='state-load')
+STATE_WRITE_SECONDS = Histogram(
+    'pokemon_state_write_seconds', 'Serializing and writing tournaments to SQLite',
+    ['kind'], timing_name='state-write')
+JOURNAL_APPEND_SECONDS = Histogram(
+    'pokemon_journal_append_seconds', 'Appending and fsyncing one journal record, including lock wait',
+    timing_name='journal')
+JOURNAL_BYTES = Counter('pokemon_journal_bytes_total', 'Bytes appended to the journal')
+EVICTIONS = Counter('pokemon_tournament_evictions_total', 'Tournaments spilled out of the in-memory cache')
+
+
+def new_game_state():
+    return {
+        'current_round': 1,
+        'current_pokemon': [],
+        'winners': [],
+        'game_history': []
+    }
+
+
+def apply_record(game_state, record):
+    """Apply one journal record to game_state in place and return its result"""
+    op = record['op']
+    if op == 'vote':
+        first, second = game_state['current_pokemon'][:2]
+        if record['choice'] == 'pokemon1':
+            winner, loser = first, second
+        else:
+            winner, loser = second, first
+        if game_state['game_history']:
+            current = game_state['game_history'][-1]
+            current['votes'] = current.get('votes', 0) + 1
+        if game_state.get('mode') == 'ranking':
+            game_state['ranking']['comparisons'].append([winner['id'], loser['id']])
+            ranking.advance(game_state)
+            return winner, loser
+        del game_state['current_pokemon'][:2]
+        game_state['winners'].append(winner)
+        return winner, loser
+    if op == 'votes':
+        outcomes = [apply_record(game_state, {'op': 'vote', 'choice': choice})
+                    for choice in record['choices']]
+        recent_keys = game_state.setdefault('recent_vote_keys', [])
+        recent_keys.extend(key for key in record['keys'] if key is not None)
+        del recent_keys[:-RECENT_VOTE_KEYS]
+        return outcomes
+    if op == 'bye':
+        game_state['winners'].extend(game_state['current_pokemon'])
+        game_state['current_pokemon'] = []
+        return None
+    if op == 'start_round':
+        game_state['current_round'] = record['round']
+        game_state['current_pokemon'] = list(record['pokemon'])
+        game_state['winners'] = []
+        game_state['game_history'].append({
+            'round': record['round'],
+            'total_pokemon': len(record['pokemon']),
+            'started_at': record['started_at']
+        })
+        return None
+    if op == 'start_ranking':
+        game_state['mode'] = 'ranking'
+        game_state['current_round'] = 1
+        game_state['winners'] = []
+        game_state['ranking'] = {
+            'entrants': list(record['pokemon']),
+            'comparisons': [],
+            'result': None
+        }
+        game_state['game_history'].append({
+            'round': 1,
+            'mode': 'ranking',
+            'total_pokemon': len(record['pokemon']),
+            'started_at': record['started_at']
+        })
+        ranking.advance(game_state)
+        return None
+    if op == 'reset':
+        game_state.clear()
+        game_state.update(new_game_state())
+        return None
+    raise ValueError(f'Unknown journal record: {op!r}')
+
+
+def record_events(record, result):
+    """Describe an applied record as the events delta polls and spectators see.
+
+    Pokemon are referred to by id; their details are in the full state.
+    """
+    op = record['op']
+    if op == 'vote':
+        winner, loser = result
+        return [{'type': 'vote', 'winner': winner['id'], 'loser': loser['id']}]
+    if op == 'votes':
+        return [{'type': 'vote', 'winner': winner['id'], 'loser': loser['id']} for winner, loser in result]
+    if op == 'bye':
+        return [{'type': 'bye'}]
+    if op == 'start_round':
+        return [{'type': 'round_started', 'round': record['round'],
+                 'pokemon': [pokemon['id'] for pokemon in record['pokemon']]}]
+    if op == 'start_ranking':
+        return [{'type': 'ranking_started', 'pokemon': [pokemon['id'] for pokemon in record['pokemon']]}]
+    return [{'type': op}]
+
+
+class FeedEntry:
+    """The events of one applied record, as kept in a tournament's feed"""
+    __slots__ = ('seq', 'events', 'size', '_message')
+
+    def __init__(self, seq, events):
+        self.seq = seq
+        self.events = events
+        self.size = sum(EVENT_BYTES + POKEMON_ID_BYTES * len(event.get('pokemon', ())) for event in events)
+        self._message = None
+
+    @property
+    def message(self):
+        """The entry as JSON, serialized on first read and shared by every spectator"""
+        if self._message is None:
+            self._message = json.dumps({'version': self.seq, 'events': self.events})
+        return self._message
+
+
+class Tournament:
+    """One session's game state; hold ``lock`` while reading or changing it"""
+
+    def __init__(self, store, tournament_id, state, seq=0):
+        self.store = store
+        self.id = tournament_id
+        self.state = state
+        self.lock = threading.RLock()
+        # Journal sequence numbers of the last record applied to state and
+        # of the last one covered by the row in SQLite
+        self.seq = seq
+        self.saved_seq = seq
+        self.evicted = False
+        self.last_used = time.monotonic()
+
+        # FeedEntry for every record after feed_since, up to about FEED_BYTES.
+        # ``changed`` is notified on each append.
+        self.feed = deque()
+        self.feed_bytes = 0
+        self.feed_since = seq
+        self.changed = threading.Condition()
+        self.spectators = 0
+
+    def append(self, record):
+        """Make record durable, apply it to the state and return its result.
+
+        The record is journaled first, so a failed write leaves the state
+        untouched and the client can safely retry.
+        """
+        with self.lock:
+            seq = self.store._journal_append(dict(record, tid=self.id))
+            result = apply_record(self.state, record)
+            self.seq = seq
+            self._publish(record_events(record, result))
+            return result
+
+    def _publish(self, events):
+        entry = FeedEntry(self.seq, events)
+        with self.changed:
+            self.feed.append(entry)
+            self.feed_bytes += entry.size
+            while self.feed_bytes > FEED_BYTES and len(self.feed) > 1:
+                dropped = self.feed.popleft()
+                self.feed_bytes -= dropped.size
+                self.feed_since = dropped.seq
+            self.changed.notify_all()
+
+    def changes_since(self, version):
+        """Feed entries after version, or None if they are no longer all kept"""
+        with self.changed:
+            if version < self.feed_since or version > self.seq:
+                return None
+            return [entry for entry in self.feed if entry.seq > version]
+
+    @property
+    def dirty(self):
+        return self.seq > self.saved_seq
+
+
+class TournamentStore:
+    """LRU of hot tournaments backed by SQLite and an append-only journal"""
+
+    def __init__(self, db_path, journal_path, max_tournaments=10000,
+                 max_idle=1800, snapshot_every=500, sweep_interval=60):
+        self.db_path = db_path
+        self.journal_path = journal_path
+        self.max_tournaments = max_tournaments
+        self.max_idle = max_idle
+        self.snapshot_every = snapshot_every
+        self.sweep_interval = sweep_interval
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._snapshot_running = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS tournaments ('
+            ' id TEXT PRIMARY KEY,'
+            ' state TEXT NOT NULL,'
+            ' journal_seq INTEGER NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        self._db.commit()
+
+        # Carry on numbering after the newest record SQLite already covers,
+        # even when a snapshot has trimmed it out of the journal
+        self._seq = self._db.execute('SELECT COALESCE(MAX(journal_seq), 0) FROM tournaments').fetchone()[0]
+        # Bytes appended to the journal by this process
+        self.journal_bytes = 0
+        # (seq, line) for every record not yet covered by SQLite
+        self._pending = []
+        # Not opened until recovery is done, and no snapshot runs before then
+        self._journal = None
+        self._recover()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+        self._stop = threading.Event()
+        threading.Thread(target=self._sweep_loop, daemon=True).start()
+
+    @property
+    def hot_count(self):
+        """Number of tournaments currently held in memory"""
+        return len(self._cache)
+
+    @contextmanager
+    def tournament(self, tournament_id, create=True):
+        """Yield the locked Tournament for tournament_id, creating it if new.
+
+        With create=False an unknown tournament raises KeyError instead.
+        """
+        while True:
+            tournament = self._get(tournament_id, create)
+            if tournament is None:
+                raise KeyError(tournament_id)
+            tournament.lock.acquire()
+            if not tournament.evicted:
+                break
+            # Spilled between lookup and lock; load it again
+            tournament.lock.release()
+        try:
+            yield tournament
+        finally:
+            tournament.lock.release()
+
+    def _get(self, tournament_id, create=True):
+        with self._cache_lock:
+            tournament = self._cache.get(tournament_id)
+            if tournament is None:
+                tournament = self._load(tournament_id, create)
+                if tournament is None:
+                    return None
+                self._cache[tournament_id] = tournament
+            else:
+                self._cache.move_to_end(tournament_id)
+            tournament.last_used = time.monotonic()
+            self._evict_over_size()
+            return tournament
+
+    def _load(self, tournament_id, create=True):
+        with STATE_LOAD_SECONDS.time():
+            with self._db_lock:
+                row = self._db.execute(
+                    'SELECT state, journal_seq FROM tournaments WHERE id = ?', (tournament_id,)
+                ).fetchone()
+            if row is None:
+                if not create:
+                    return None
+                return Tournament(self, tournament_id, new_game_state())
+            return Tournament(self, tournament_id, json.loads(row[0]), row[1])
+
+    def _evict_over_size(self):
+        """Drop least recently used tournaments while over max_tournaments.
+
+        Call with _cache_lock held.  Only the head of the LRU is examined and
+        nothing is written here: a tournament with unsaved changes stops the
+        loop and starts a snapshot, after which it can be dropped.
+        """
+        for _ in range(len(self._cache) - self.max_tournaments):
+            tournament = next(iter(self._cache.values()))
+            if tournament.dirty:
+                self._start_snapshot()
+                break
+            if not self._try_evict(tournament):
+                # In use right now, so it is not least recently used after all
+                self._cache.move_to_end(tournament.id)
+
+    def _try_evict(self, tournament):
+        """Drop a saved, unused tournament from the cache; call with _cache_lock held"""
+        if tournament.spectators or not tournament.lock.acquire(blocking=False):
+            return False
+        try:
+            if tournament.dirty:
+                return False
+            EVICTIONS.inc()
+            tournament.evicted = True
+            del self._cache[tournament.id]
+            return True
+        finally:
+            tournament.lock.release()
+
+    def sweep_idle(self):
+        """Write out and drop tournaments unused for longer than max_idle"""
+        cutoff = time.monotonic() - self.max_idle
+        with self._cache_lock:
+            # The LRU is ordered by last use, so the idle ones are at its head
+            idle = list(takewhile(lambda t: t.last_used < cutoff, self._cache.values()))
+        if not idle:
+            return
+
+        rows = []
+        saved = []
+        for tournament in idle:
+            if not tournament.lock.acquire(blocking=False):
+                continue  # in use after all
+            try:
+                if tournament.dirty and not tournament.evicted:
+                    rows.append((tournament.id, json.dumps(tournament.state), tournament.seq))
+                    saved.append((tournament, tournament.seq))
+            finally:
+                tournament.lock.release()
+        if rows:
+            with STATE_WRITE_SECONDS.time(kind='spill'):
+                self._write_rows(rows)
+            for tournament, seq in saved:
+                with tournament.lock:
+                    tournament.saved_seq = max(tournament.saved_seq, seq)
+
+        with self._cache_lock:
+            for tournament in idle:
+                if tournament.last_used < cutoff and not tournament.evicted:
+                    self._try_evict(tournament)
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep_idle()
+            except sqlite3.Error as e:
+                print(f"Spilling idle tournaments failed: {e}")
+
+    def _write_rows(self, rows):
+        now = time.time()
+        with self._db_lock:
+            self._db.executemany(
+                'INSERT INTO tournaments (id, state, journal_seq, updated_at) VALUES (?, ?, ?, ?)'
+                ' ON CONFLICT(id) DO UPDATE SET state = excluded.state,'
+                ' journal_seq = excluded.journal_seq, updated_at = excluded.updated_at'
+                ' WHERE excluded.journal_seq >= tournaments.journal_seq',
+                [(tid, state, seq, now) for tid, state, seq in rows]
+            )
+            self._db.commit()
+
+    def _recover(self):
+        if not os.path.exists(self.journal_path):
+            return
+
+        good_bytes = 0
+        with open(self.journal_path, 'rb') as f:
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break  # torn write from a crash mid-append
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    break
+                good_bytes += len(raw)
+                self._seq = max(self._seq, record['seq'])
+                self._pending.append((record['seq'], raw.decode('utf-8')))
+                tournament = self._get(record['tid'])
+                if record['seq'] > tournament.seq:
+                    try:
+                        apply_record(tournament.state, record)
+                    except (KeyError, IndexError, TypeError, ValueError) as e:
+                        # Start without it rather than not at all
+                        print(f"Skipping journal record {record['seq']} that cannot be replayed: {e!r}")
+                    tournament.seq = tournament.feed_since = record['seq']
+
+        if good_bytes < os.path.getsize(self.journal_path):
+            print(f"Discarding torn tail of {self.journal_path} after {good_bytes} bytes")
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(good_bytes)
+        if self._pending:
+            print(f"Replayed {len(self._pending)} journal records")
+
+    def _journal_append(self, record):
+        with JOURNAL_APPEND_SECONDS.time(), self._journal_lock:
+            line = json.dumps(dict(record, seq=self._seq + 1), separators=(',', ':')) + '\n'
+            good_bytes = self._journal.tell()
+            try:
+                self._journal.write(line)
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+            except OSError:
+                self._discard_journal_tail(good_bytes)
+                raise
+            self._seq += 1
+            self.journal_bytes += len(line)
+            JOURNAL_BYTES.inc(len(line))
+            self._pending.append((self._seq, line))
+            if len(self._pending) >= self.snapshot_every:
+                self._start_snapshot()
+            return self._seq
+
+    def _discard_journal_tail(self, good_bytes):
+        """Drop a record whose write failed so a restart cannot replay it"""
+        try:
+            self._journal.close()
+        except OSError:
+            pass  # the buffered partial line is thrown away with the file object
+        with open(self.journal_path, 'r+b') as f:
+            f.truncate(good_bytes)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _start_snapshot(self):
+        if self._journal is None:
+            return  # still recovering; the journal is not open yet
+        if not self._snapshot_running.acquire(blocking=False):
+            return  # one is already being written
+        threading.Thread(target=self._write_snapshot, daemon=True).start()
+
+    def snapshot(self):
+        """Write dirty tournaments to SQLite synchronously and trim the journal"""
+        with self._snapshot_running:
+            self._write_snapshot_rows()
+
+    def _write_snapshot(self):
+        try:
+            self._write_snapshot_rows()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Snapshot failed, journal kept: {e}")
+        finally:
+            self._snapshot_running.release()
+
+    def _write_snapshot_rows(self):
+        # Every record up to this point is reflected in the states copied below
+        with self._journal_lock:
+            upto = self._seq
+        with self._cache_lock:
+            hot = list(self._cache.values())
+
+        rows = []
+        saved = []
+        with STATE_WRITE_SECONDS.time(kind='snapshot'):
+            for tournament in hot:
+                with tournament.lock:
+                    if tournament.dirty and not tournament.evicted:
+                        rows.append((tournament.id, json.dumps(tournament.state), tournament.seq))
+                        saved.append((tournament, tournament.seq))
+            self._write_rows(rows)
+            with self._db_lock:
+                # Make this and every earlier spill durable before trimming
+                self._db.execute('PRAGMA wal_checkpoint(FULL)')
+        for tournament, seq in saved:
+            with tournament.lock:
+                tournament.saved_seq = max(tournament.saved_seq, seq)
+
+        # Records appended while the rows were written stay in the journal
+        with self._journal_lock:
+            self._pending = [(s, line) for s, line in self._pending if s > upto]
+            tmp_path = self.journal_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(line for _, line in self._pending)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal.close()
+            os.replace(tmp_path, self.journal_path)
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def close(self):
+        self._stop.set()
+        with self._journal_lock:
+            self._journal.close()
+        with self._db_lock:
+            self._db.close()
@@ -1,26 +1,41 @@
+// Pairs are fetched in batches and votes sent in batches, so most clicks
+// show the next match without waiting for the server
+const PREFETCH_COUNT = 16;
+const REFILL_AT = 4;
+
+let upcoming = [];
+let currentMatch = null;
+let currentRound = 1;
+let matchesLeft = 0;
+let pendingVotes = [];
+let inFlight = null;
+
 async function loadMatch() {
-    const res = await fetch('/api/current-match');
+    await flushVotes(false);
+    const res = await fetch(`/api/upcoming-matches?count=${PREFETCH_COUNT}`);
     if (!res.ok) {
         // Tournament over or round complete
         document.body.innerHTML = `
             <div style="color:white;text-align:center;font-size:2em;display:flex;flex-direction:column;align-items:center;justify-content:center;height:100vh;">
                 <div>Tournament Complete!</div>
                 <button id="restart-btn" style="margin-top:20px;padding:10px 20px;font-size:1em;background:#444;color:white;border:none;border-radius:5px;cursor:pointer;">Restart Tournament</button>
+                <button id="ranking-btn" style="margin-top:10px;padding:10px 20px;font-size:0.6em;background:#444;color:white;border:none;border-radius:5px;cursor:pointer;">Rank Every Pokémon</button>
                 <div style="margin-top:10px;font-size:0.5em;">Press 'R' to restart</div>
             </div>
         `;
-        document.getElementById('restart-btn').addEventListener('click', restartTournament);
+        document.getElementById('restart-btn').addEventListener('click', () => restartTournament());
+        document.getElementById('ranking-btn').addEventListener('click', () => restartTournament('ranking'));
         document.addEventListener('keydown', (e) => {
             if (e.key.toLowerCase() === 'r') restartTournament();
         });
         return;
     }
     const data = await res.json();
-    document.getElementById('left-pokemon').src = data.pokemon1.image_url;
-    document.getElementById('right-pokemon').src = data.pokemon2.image_url;
-    
-    // Update round and matches info
-    updateRoundInfo(data.current_round, data.remaining_matches);
+    upcoming = data.matches;
+    currentRound = data.current_round;
+    matchesLeft = data.remaining_matches;
+    preloadSprites(upcoming.slice(1));
+    showNextMatch();
     
     // Add auto-pick button if it doesn't exist
     if (!document.getElementById('auto-pick-btn')) {
@@ -45,6 +60,96 @@ async function loadMatch() {
     }
 }
 
+// Pre-sized variants served by /sprites (SPRITE_SIZES in sprite_cache.py)
+const SPRITE_SIZES = [256, 384];
+const SPRITE_FULL_WIDTH = 475;
+
+function setSprite(img, pokemon) {
+    if (pokemon.image_url.startsWith('/sprites/')) {
+        img.srcset = SPRITE_SIZES
+            .map(size => `/sprites/${pokemon.id}-${size}.png ${size}w`)
+            .concat(`${pokemon.image_url} ${SPRITE_FULL_WIDTH}w`)
+            .join(', ');
+    } else {
+        img.removeAttribute('srcset');
+    }
+    img.src = pokemon.image_url;
+}
+
+function showNextMatch() {
+    currentMatch = upcoming.shift();
+    setSprite(document.getElementById('left-pokemon'), currentMatch.pokemon1);
+    setSprite(document.getElementById('right-pokemon'), currentMatch.pokemon2);
+    
+    // Update round and matches info
+    updateRoundInfo(currentRound, matchesLeft);
+}
+
+function preloadSprites(matches) {
+    const sizes = document.getElementById('left-pokemon').sizes;
+    for (const match of matches) {
+        for (const pokemon of [match.pokemon1, match.pokemon2]) {
+            const img = new Image();
+            img.sizes = sizes;
+            setSprite(img, pokemon);
+        }
+    }
+}
+
+function newVoteKey() {
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Send queued votes in one request; with refill, also take the next pairs
+function flushVotes(refill) {
+    if (inFlight) {
+        return inFlight.then(() => flushVotes(refill));
+    }
+    const votes = pendingVotes;
+    if (!votes.length && !refill) {
+        return Promise.resolve();
+    }
+    pendingVotes = [];
+    let resync = false;
+    inFlight = (async () => {
+        try {
+            const res = await fetch('/api/choose-pokemon-batch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ votes, upcoming: refill ? PREFETCH_COUNT : 0 })
+            });
+            const data = await res.json();
+            if (!res.ok) {
+                console.error('Votes rejected:', data.error);
+                resync = true;
+                return;
+            }
+            if (refill) {
+                // Skip the pairs voted on or shown since this request was sent
+                const skip = pendingVotes.length + (currentMatch ? 1 : 0);
+                upcoming = data.matches.slice(skip);
+                currentRound = data.current_round;
+                matchesLeft = data.remaining_matches - pendingVotes.length;
+                preloadSprites(upcoming);
+            }
+        } catch (error) {
+            // Keys make resending the same votes safe
+            console.error('Failed to send votes, will retry:', error);
+            pendingVotes = votes.concat(pendingVotes);
+        } finally {
+            inFlight = null;
+        }
+    })();
+    return inFlight.then(() => {
+        if (resync) {
+            pendingVotes = [];
+            upcoming = [];
+            currentMatch = null;
+            return loadMatch();
+        }
+    });
+}
+
 function updateRoundInfo(round, matchesLeft) {
     let roundInfo = document.getElementById('round-info');
     if (!roundInfo) {
@@ -73,6 +178,7 @@ async function autoCompleteRound() {
     btn.textContent = 'Completing...';
     
     try {
+        await flushVotes(false);
         let roundCount = 0;
         const maxRounds = 10; // Safety limit
         
@@ -143,18 +249,39 @@ async function autoCompleteRound() {
     }
 }
 
-async function restartTournament() {
-    await fetch('/api/reset-game', { method: 'POST' });
+async function restartTournament(mode = 'bracket') {
+    // Votes not sent yet belong to the old tournament
+    pendingVotes = [];
+    await fetch('/api/reset-game', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ mode })
+    });
     loadMatch();
 }
 
 async function choose(side) {
-    await fetch('/api/choose-pokemon', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ choice: side === 'left' ? 'pokemon1' : 'pokemon2' })
+    if (!currentMatch) return;
+    pendingVotes.push({
+        key: newVoteKey(),
+        choice: side === 'left' ? 'pokemon1' : 'pokemon2',
+        pokemon1_id: currentMatch.pokemon1.id,
+        pokemon2_id: currentMatch.pokemon2.id
     });
-    loadMatch();
+    currentMatch = null;
+    matchesLeft--;
+    
+    if (!upcoming.length) {
+        await flushVotes(true);
+        if (currentMatch) return;  // resynced with the server meanwhile
+        if (!upcoming.length) {
+            loadMatch();
+            return;
+        }
+    } else if (upcoming.length <= REFILL_AT && !inFlight) {
+        flushVotes(true);
+    }
+    showNextMatch();
 }
 
 document.addEventListener('DOMContentLoaded', () => {
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+import ranking
+from state_store import apply_record, new_game_state
+
+
+def sort_counting(items):
+    comparisons = []
+
+    def less(first, second):
+        comparisons.append((first, second))
+        return first < second
+
+    return ranking.merge_insertion_sort(items, less), len(comparisons)
+
+
+@pytest.mark.parametrize('count', list(range(30)) + [151])
+def test_sorts_within_comparison_bound(count):
+    rng = random.Random(count)
+    for _ in range(20):
+        items = list(range(count))
+        rng.shuffle(items)
+        result, comparisons = sort_counting(items)
+        assert result == sorted(items)
+        assert comparisons <= ranking.max_comparisons(count)
+
+
+def test_insertion_order_covers_every_pend_element():
+    for count in range(1, 60):
+        assert sorted(ranking.insertion_order(count)) == list(range(1, count))
+
+
+def test_votes_produce_full_ranking():
+    # Lower id is the favourite in every match
+    pokemon = [{'id': i, 'name': f'Pokemon {i}'} for i in range(1, 41)]
+    random.Random(7).shuffle(pokemon)
+    game_state = new_game_state()
+    apply_record(game_state, {'op': 'start_ranking', 'pokemon': pokemon, 'started_at': ''})
+
+    votes = 0
+    while game_state['current_pokemon']:
+        first, second = game_state['current_pokemon']
+        choice = 'pokemon1' if first['id'] < second['id'] else 'pokemon2'
+        apply_record(game_state, {'op': 'vote', 'choice': choice})
+        votes += 1
+
+    assert [p['id'] for p in game_state['ranking']['result']] == list(range(1, 41))
+    assert votes <= ranking.max_comparisons(40)
+    assert ranking.remaining_comparisons(game_state) == 0
+
+
+def test_replay_asks_for_the_first_unanswered_pair():
+    order, pair = ranking.replay([1, 2, 3], [])
+    assert order is None
+    assert pair == (1, 2)
+    order, pair = ranking.replay([1, 2], [(2, 1)])
+    assert order == [2, 1]
+    assert pair is None
@@ -0,0 +1,205 @@
+import json
+import threading
+
+import pytest
+
+from state_store import TournamentStore
+
+POKEMON = [{'id': i, 'name': f'Pokemon {i}'} for i in range(1, 9)]
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'tournaments.db'), str(tmp_path / 'game_state.journal')
+
+
+def open_store(paths, **kwargs):
+    return TournamentStore(*paths, **kwargs)
+
+
+def start(store, tournament_id):
+    with store.tournament(tournament_id) as tournament:
+        tournament.append({'op': 'start_round', 'round': 1, 'pokemon': POKEMON, 'started_at': ''})
+
+
+def vote(store, tournament_id, votes=1):
+    with store.tournament(tournament_id) as tournament:
+        for _ in range(votes):
+            tournament.append({'op': 'vote', 'choice': 'pokemon1'})
+        return tournament.seq
+
+
+def winners(store, tournament_id):
+    with store.tournament(tournament_id, create=False) as tournament:
+        return [pokemon['id'] for pokemon in tournament.state['winners']]
+
+
+def journal_records(paths):
+    with open(paths[1]) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_replays_journal_on_restart(paths):
+    store = open_store(paths)
+    start(store, 'a')
+    seq = vote(store, 'a', 2)
+    store.close()
+
+    store = open_store(paths)
+    assert winners(store, 'a') == [1, 3]
+    with store.tournament('a') as tournament:
+        assert tournament.seq == seq
+    store.close()
+
+
+def test_discards_torn_tail(paths):
+    store = open_store(paths)
+    start(store, 'a')
+    vote(store, 'a')
+    store.close()
+    with open(paths[1], 'a') as f:
+        f.write('{"op":"vote","choice":"pok')
+
+    store = open_store(paths)
+    assert winners(store, 'a') == [1]
+    vote(store, 'a')
+    store.close()
+
+    assert [record['op'] for record in journal_records(paths)] == ['start_round', 'vote', 'vote']
+    store = open_store(paths)
+    assert winners(store, 'a') == [1, 3]
+    store.close()
+
+
+def test_snapshot_trims_journal(paths):
+    store = open_store(paths)
+    start(store, 'a')
+    vote(store, 'a', 2)
+    store.snapshot()
+    assert journal_records(paths) == []
+    store.close()
+
+    store = open_store(paths)
+    assert winners(store, 'a') == [1, 3]
+    store.close()
+
+
+def test_sequence_keeps_increasing_after_snapshot_and_restart(paths):
+    store = open_store(paths)
+    start(store, 'a')
+    before = vote(store, 'a', 2)
+    store.snapshot()
+    store.close()
+
+    store = open_store(paths)
+    after = vote(store, 'a')
+    assert after > before
+    store.close()
+
+    store = open_store(paths)
+    assert winners(store, 'a') == [1, 3, 5]
+    store.close()
+
+
+def test_records_appended_during_snapshot_stay_in_journal(paths):
+    store = open_store(paths)
+    start(store, 'a')
+    start(store, 'b')
+    write_rows = store._write_rows
+
+    def write_rows_while_voting(rows):
+        # Another session votes while the snapshot's rows are being written
+        voter = threading.Thread(target=vote, args=(store, 'b'))
+        voter.start()
+        voter.join()
+        write_rows(rows)
+
+    store._write_rows = write_rows_while_voting
+    store.snapshot()
+    store._write_rows = write_rows
+    assert [(record['tid'], record['op']) for record in journal_records(paths)] == [('b', 'vote')]
+    store.close()
+
+    store = open_store(paths)
+    assert winners(store, 'b') == [1]
+    store.close()
+
+
+def test_stale_row_does_not_overwrite_newer_one(paths):
+    store = open_store(paths)
+    start(store, 'a')
+    with store.tournament('a') as tournament:
+        stale = (tournament.id, json.dumps(tournament.state), tournament.seq)
+    vote(store, 'a')
+    store.snapshot()
+
+    # A snapshot that copied the row before the vote finishes writing late
+    store._write_rows([stale])
+    store.close()
+
+    store = open_store(paths)
+    assert winners(store, 'a') == [1]
+    store.close()
+
+
+def test_evicted_tournament_reloads_with_every_vote(paths):
+    store = open_store(paths, max_idle=0)
+    start(store, 'a')
+    vote(store, 'a', 2)
+    store.sweep_idle()
+    assert store.hot_count == 0
+    assert winners(store, 'a') == [1, 3]
+    vote(store, 'a')
+    store.close()
+
+    store = open_store(paths)
+    assert winners(store, 'a') == [1, 3, 5]
+    store.close()
+
+
+def test_over_size_keeps_unsaved_tournaments_until_snapshot(paths):
+    store = open_store(paths, max_tournaments=1)
+    start(store, 'a')
+    start(store, 'b')
+    store.snapshot()
+    assert store.hot_count == 2
+    start(store, 'c')
+    store.snapshot()
+    with store.tournament('c'):
+        pass
+    assert store.hot_count == 1
+    assert winners(store, 'a') == []
+    store.close()
+
+
+def test_failed_journal_write_leaves_state_untouched(paths, monkeypatch):
+    store = open_store(paths)
+    start(store, 'a')
+
+    def fail(fd):
+        raise OSError('disk full')
+
+    monkeypatch.setattr('state_store.os.fsync', fail)
+    with pytest.raises(OSError):
+        vote(store, 'a')
+    monkeypatch.undo()
+    assert winners(store, 'a') == []
+    vote(store, 'a')
+    store.close()
+
+    store = open_store(paths)
+    assert winners(store, 'a') == [1]
+    store.close()
+
+
+def test_skips_record_that_cannot_be_replayed(paths):
+    store = open_store(paths)
+    start(store, 'a')
+    store.close()
+    with open(paths[1], 'a') as f:
+        f.write(json.dumps({'op': 'unknown', 'tid': 'a', 'seq': 2}) + '\n')
+        f.write(json.dumps({'op': 'vote', 'choice': 'pokemon1', 'tid': 'a', 'seq': 3}) + '\n')
+
+    store = open_store(paths)
+    assert winners(store, 'a') == [1]
+    store.close()